@@ -0,0 +1,149 @@
+"""Differential fuzzing of the settipy parse fast path against the reference.
+Random flags, argv, environments and env prefixes are parsed by both,
+the values, the flags that were set and the errors and their reports should be identical.
+
+$ python fuzz.py -cases 10000 -seed 1
+"""
+import os
+import io
+import sys
+import time
+import random
+from unittest import mock
+
+import settipy
+
+# "-a" is found on the cli as "--a", the same token as flag "a" with "--".
+NAMES = ["a", "b", "ab", "A", "a-b", "-a", "DB_HOST", "x1"]
+VALUES = [
+    "", "x", "-", "--", "-x", "--x", "1", "-1", "042", "y", "yes", "true", "True",
+    "a,b", "a,,b", "k:v", "k:v;k2:v2", "k:v,w;k2:", "k:v:w", ":", ";", ",", ".", " ", "k",
+]
+TYPES = ["str", "int", "bool", "list", "dict", "dict_list"]
+SEPS = [",", ";", ":", ".", "-"]
+# Prefix "a" with flag "b" reads env var "ab", the same name as flag "ab".
+ENV_PREFIXES = ["", "", "APP_", "a", "A_"]
+OPTIONS = VALUES + [None, 1, 42, True, False]
+
+EDGE_CASES = [
+    ([("a", "str", (), {})], ["./fuzz.py", "-a"], {}, ""),
+    ([("a", "str", (), {})], ["./fuzz.py", "-a", "-b"], {}, ""),
+    ([("a", "str", (), {})], ["./fuzz.py", "--a", "--"], {}, ""),
+    ([("a", "str", (), {}), ("-a", "str", (), {})], ["./fuzz.py", "--a", "x"], {}, ""),
+    ([("a", "str", (), {})], ["./fuzz.py", "--a", "x", "-a", "y"], {"a": "env"}, ""),
+    ([("a", "bool", (), {})], ["./fuzz.py"], {"a": ""}, ""),
+    ([("a", "bool", (), {})], ["./fuzz.py", "-a"], {}, ""),
+    ([("a", "list", (",",), {})], ["./fuzz.py", "-a", "x,,y"], {}, ""),
+    ([("a", "dict", (";", ":"), {})], ["./fuzz.py", "-a", "k:v:w"], {}, ""),
+    ([("a", "dict_list", (";", ":", ","), {})], ["./fuzz.py"], {"a": "k:v,w;k2:"}, ""),
+    ([("a", "int", (), {})], ["./fuzz.py", "-a", "-1"], {}, ""),
+    ([("a", "str", (), {})], ["./fuzz.py"], {"APP_a": "prefixed", "a": "plain"}, "APP_"),
+    ([("b", "str", (), {}), ("ab", "str", (), {})], ["./fuzz.py"], {"ab": "x", "aab": "y"}, "a"),
+    ([("a", "bool", (), {})], ["./fuzz.py"], {"A_a": ""}, "A_"),
+    ([("a", "str", (), {"should": True})], ["./fuzz.py", "-a"], {}, ""),
+    ([("a", "str", (), {"should": True})], ["./fuzz.py"], {"APP_a": "x"}, ""),
+    ([("a", "str", (), {"should_if": ("b",)}), ("b", "str", (), {})], ["./fuzz.py", "--b", "x"], {}, ""),
+    ([("a", "list", (",",), {"options": ("x", "")})], ["./fuzz.py", "-a", "x,,y"], {}, ""),
+]
+
+
+def random_case(rng):
+    flags = []
+    names = rng.sample(NAMES, rng.randint(1, len(NAMES)))
+    for name in names:
+        type_ = rng.choice(TYPES)
+        seps = {"list": 1, "dict": 2, "dict_list": 3}.get(type_, 0)
+        checks = {}
+        if rng.random() < 0.2:
+            checks["should"] = True
+        if rng.random() < 0.2:
+            checks["should_if"] = tuple(rng.sample(names, rng.randint(1, len(names))))
+        if rng.random() < 0.2:
+            checks["options"] = tuple(rng.sample(OPTIONS, rng.randint(1, 6)))
+        flags.append((name, type_, tuple(rng.choice(SEPS) for _ in range(seps)), checks))
+
+    tokens = [prefix + name for prefix in ("-", "--") for name in NAMES] + VALUES
+    argv = ["./fuzz.py"] + [rng.choice(tokens) for _ in range(rng.randint(0, 8))]
+    env_prefix = rng.choice(ENV_PREFIXES)
+    env = {
+        rng.choice(["", env_prefix]) + name: rng.choice(VALUES)
+        for name in rng.sample(NAMES, rng.randint(0, len(NAMES)))
+    }
+    return flags, argv, env, env_prefix
+
+
+def register(setpy, flags):
+    for name, type_, seps, checks in flags:
+        if type_ == "list":
+            setpy.set_list(name, [], "fuzz", sep=seps[0], **checks)
+        elif type_ == "dict":
+            setpy.set_dict(name, {}, "fuzz", item_sep=seps[0], key_sep=seps[1], **checks)
+        elif type_ == "dict_list":
+            setpy.set_dict_list(name, {}, "fuzz", item_sep=seps[0], key_sep=seps[1], sep=seps[2], **checks)
+        else:
+            setpy.set(name, None, "fuzz", type_=type_, **checks)
+
+
+class Recorder(settipy.Settipy):
+    """Keeps the flags that were set, clean drops them after parse."""
+
+    def _handle_clean(self):
+        self.flags_set = set(self.data_set)
+        super()._handle_clean()
+
+
+def run(case, fast_parse):
+    """Parsed values and the flags that were set, or the type and message of the error with the reports printed,
+    and the seconds parse took.
+    """
+    flags, argv, env, env_prefix = case
+    setpy = Recorder()
+    setpy.fast_parse = fast_parse
+    setpy.env_prefix = env_prefix
+    register(setpy, flags)
+    with mock.patch.object(sys, "argv", argv):
+        with mock.patch.dict(os.environ, env, clear=True):
+            with mock.patch("sys.stdout", new_callable=io.StringIO) as stdout:
+                start = time.perf_counter()
+                try:
+                    setpy.parse()
+                except (Exception, SystemExit) as e:
+                    # Validation reports are printed before the exit.
+                    return (None, None, (type(e), str(e)), stdout.getvalue()), time.perf_counter() - start
+                return (setpy.data, setpy.flags_set, None, None), time.perf_counter() - start
+
+
+def differential(cases):
+    """Cases where the fast path differs from the reference, and the seconds both spent parsing."""
+    mismatches = []
+    timings = {False: 0.0, True: 0.0}
+    for case in cases:
+        results = {}
+        for fast_parse in (False, True):
+            results[fast_parse], elapsed = run(case, fast_parse)
+            timings[fast_parse] += elapsed
+        if results[False] != results[True]:
+            mismatches.append((case, results[False], results[True]))
+    return mismatches, timings[False], timings[True]
+
+
+def generate(seed, count):
+    rng = random.Random(seed)
+    return EDGE_CASES + [random_case(rng) for _ in range(count)]
+
+
+if __name__ == "__main__":
+    setpy = settipy.settipy
+    setpy.set_int("cases", 10000, "number of random cases")
+    setpy.set_int("seed", 0, "seed of the random cases")
+    setpy.parse()
+
+    cases = generate(setpy["seed"], setpy["cases"])
+    mismatches, reference, fast = differential(cases)
+
+    print(f"reference: {len(cases) / reference:.0f} parses/s")
+    print(f"fast:      {len(cases) / fast:.0f} parses/s")
+    for case, expected, result in mismatches:
+        print(f"mismatch {case}\n\treference: {expected}\n\tfast:      {result}")
+    if mismatches:
+        sys.exit(1)
@@ -1,5 +1,10 @@
 import os
 import sys
+import time
+
+HANDOFF_VERSION = "SETTIPY1"
+HANDOFF_ENV = "SETTIPY_HANDOFF"
+HANDOFF_FD_ENV = "SETTIPY_HANDOFF_FD"
 
 
 class Settipy():
@@ -11,22 +16,17 @@ class Settipy():
         >>> type(True).__name__
         'bool'
     """
+    collection_types = frozenset({"list", "dict", "dict_list"})
+
     def __init__(self):
         self.data = {}
         self.parsed = False
+        self.truthy = {"y", "yes", "true", ""}
         self.print_at_startup = False
+        self.env_prefix = ""
         self.data_type = {}
         self.messages = {}
         self.data_set = set()
-        self.truthy = {"y", "yes", "true", ""}
-        self.casters = {
-            "str": self._to_str,
-            "int": self._to_int,
-            "bool": self._truthiness,
-            "list": self._to_list,
-            "dict": self._to_dict,
-            "dict_list": self._to_dict_list,
-        }
         self.list_sep = {}
         self.dict_seps = {}
         self.dict_list_seps = {}
@@ -34,12 +34,29 @@ class Settipy():
         self.conditional_should = {}
         self.options = {}
         self.password_fields = {}
+        self.secret_providers = {}
+        self.default_secret_provider = None
+        self.secret_flags = {}
+        self.sources = []
+        self.source_flags = []
+        self.schema = None
+        self.groups = {}
+        self.subscribers = {}
+        self.prefix_subscribers = {}
+        self.pending_notifications = {}
+        self.notify_lock = None
+        self.notify_executor = None
 
         self.test_mode = False
+        # Indexed env and cli lookups, guarded against the reference by fuzz.py.
+        self.fast_parse = False
 
     def __getitem__(self, key):
         return self.data[key]
 
+    def __setitem__(self, key, value):
+        self.update({key: value})
+
     def _to_str(self, v, flag):
         return str(v)
 
@@ -69,9 +86,19 @@ class Settipy():
     def _truthiness(self, v, flag):
         return v in self.truthy
 
+    # Built once for the class, names are looked up on the instance so subclasses can override casters.
+    casters = {
+        "str": "_to_str",
+        "int": "_to_int",
+        "bool": "_truthiness",
+        "list": "_to_list",
+        "dict": "_to_dict",
+        "dict_list": "_to_dict_list",
+    }
+
     def _cast(self, v, flag):
         type_ = self.data_type[flag]
-        return self.casters[type_](v, flag)
+        return getattr(self, self.casters[type_])(v, flag)
 
     def _set(self, flag_name, default, message, type_, should, should_if, options, password):
 
@@ -81,12 +108,18 @@ class Settipy():
         if should:
             self.should_be_set[flag_name] = default
         if options:
-            self.options[flag_name] = set(options)
+            # Options of list and dict flags apply to each element or key.
+            self.options[flag_name] = frozenset(options), type_ in self.collection_types
         if password:
             self.password_fields[flag_name] = True
         if should_if:
             self.conditional_should[flag_name] = set(should_if)
 
+        # "KAFKA_CONSUMER_GROUP" is part of the groups "KAFKA" and "KAFKA_CONSUMER".
+        parts = flag_name.split("_")
+        for i in range(1, len(parts)):
+            self.groups.setdefault("_".join(parts[:i]), {})[flag_name] = None
+
     def set(self, flag_name, default, message, type_="str", should=False, should_if=tuple(), options=tuple(), password=False):
         self._set(flag_name, default, message, type_, should, should_if, options, password)
 
@@ -108,6 +141,117 @@ class Settipy():
         self.dict_list_seps[flag_name] = item_sep, key_sep, sep
         self._set(flag_name, default, message, "dict_list", should, should_if, options, password)
 
+    def set_secret_provider(self, provider, flags=tuple()):
+        """Resolve password fields through provider during parse.
+        Without flags the provider is used for every password field.
+        """
+        if not flags:
+            self.default_secret_provider = provider
+        for flag in flags:
+            self.secret_providers[flag] = provider
+
+    async def refresh_secrets(self):
+        """Resolve the password fields from their providers again, from a running loop.
+        Cached values are served while entries close to expiry refresh in the background,
+        changed values are applied with update.
+        """
+        results = await _resolve_secrets(self.secret_flags)
+        failed = [flag for flag, value in results.items() if isinstance(value, Exception)]
+        self.update({
+            flag: self._cast(value, flag) for flag, value in results.items()
+            if value is not None and flag not in failed
+        })
+        if failed:
+            raise Exception(f"secrets could not be resolved for {failed}")
+
+    def add_source(self, source):
+        """Values of a source are used for flags not set by cli or env.
+        Sources added first take precedence.
+        """
+        self.sources.append(source)
+
+    def refresh(self):
+        """Fetch the sources again, changed values are applied with update."""
+        values = self._fetch_sources()
+        self.update({flag: self._cast(value, flag) for flag, value in values.items()})
+
+    def export(self):
+        """Versioned and checksummed blob of the parsed values.
+        A child process with the same flags loads it in parse, skipping env, cli, casting and validation.
+        """
+        if not self.parsed:
+            raise Exception("Values can only be exported after parse")
+
+        for flag, value in self.data.items():
+            if not _is_handoff_value(value):
+                raise TypeError(f"flag: {flag} {value!r}: can't be handed off, values should be str, int, float, bool, None, list or dict")
+
+        import json
+        import zlib
+        import base64
+        content = {"schema": _digest(repr(self.schema)), "data": self.data, "source_flags": self.source_flags}
+        payload = zlib.compress(json.dumps(content, separators=(",", ":")).encode())
+        payload = base64.urlsafe_b64encode(payload).decode()
+        return f"{HANDOFF_VERSION}.{_digest(payload)}.{payload}"
+
+    def handoff_env(self):
+        """Environment for a child process, subprocess.run(cmd, env={**os.environ, **settipy.handoff_env()})
+        The environment of a process is readable through /proc, with password fields use handoff_fd.
+        """
+        if self.password_fields:
+            raise Exception(f"password fields {list(self.password_fields)} can't be handed off in the environment, use handoff_fd")
+        return {HANDOFF_ENV: self.export()}
+
+    def handoff_fd(self):
+        """Inheritable file descriptor and environment for child processes, keeps the values out of the environment.
+        The descriptor survives exec, subprocess closes other descriptors so pass it in pass_fds.
+        subprocess.run(cmd, pass_fds=[fd], env={**os.environ, **env})
+        """
+        import tempfile
+        with tempfile.TemporaryFile() as fh:
+            fh.write(self.export().encode())
+            fh.flush()
+            fd = os.dup(fh.fileno())
+        os.set_inheritable(fd, True)
+        return fd, {HANDOFF_FD_ENV: str(fd)}
+
+    def enable_read_stats(self, every=1):
+        """Count reads of flags, sampling one in every reads.
+        Enable after parse, when disabled reads cost nothing extra.
+        """
+        if every < 1:
+            raise ValueError(f"every should be 1 or more, got {every}")
+        if isinstance(self.data, ReadCounter):
+            self.data.every = every
+            counter = self.data
+            counter.countdowns = {flag: min(countdown, every) for flag, countdown in counter.countdowns.items()}
+            return
+        self.data = ReadCounter(self.data, every)
+
+    def disable_read_stats(self):
+        self.data = dict(self.data)
+
+    def read_stats(self, hot=10):
+        """Snapshot of the estimated reads per flag, the most read flags and flags never read."""
+        if not isinstance(self.data, ReadCounter):
+            raise Exception("read stats are not enabled, call enable_read_stats")
+
+        reads = dict(self.data.reads)
+        return {
+            "every": self.data.every,
+            "reads": {flag: reads.get(flag, 0) for flag in self.data},
+            "hot": sorted(reads, key=reads.get, reverse=True)[:hot],
+            "unread": [flag for flag in self.data if flag not in reads],
+        }
+
+    def namespace(self, name):
+        """Register flags prefixed with name, namespace("DB").set("HOST", ...) sets DB_HOST."""
+        return Namespace(self, name)
+
+    def group(self, name):
+        """Read-only view of the flags in namespace name."""
+        return Group(self, self.groups.setdefault(name, {}))
+
     def get(self, k):
         return self.data[k]
 
@@ -123,8 +267,108 @@ class Settipy():
     def get_dict(self, k: str) -> dict:
         return self.data[k]
 
+    def subscribe(self, flag_or_prefix, callback, loop=None):
+        """callback is called with a dict of the changed flags and their new values.
+        A name ending with "*" subscribes to every flag starting with that prefix.
+        Callbacks run on a worker thread, or on the asyncio loop when given.
+        """
+        if self.notify_lock is None:
+            import threading
+            self.notify_lock = threading.Lock()
+
+        subscription = callback, loop
+        if flag_or_prefix.endswith("*"):
+            prefix = flag_or_prefix[:-1]
+            by_prefix = self.prefix_subscribers.setdefault(len(prefix), {})
+            by_prefix.setdefault(prefix, []).append(subscription)
+        else:
+            self.subscribers.setdefault(flag_or_prefix, []).append(subscription)
+
+    def unsubscribe(self, flag_or_prefix, callback, loop=None):
+        subscription = callback, loop
+        if flag_or_prefix.endswith("*"):
+            prefix = flag_or_prefix[:-1]
+            by_prefix = self.prefix_subscribers.get(len(prefix), {})
+            by_prefix.get(prefix, []).remove(subscription)
+            if not by_prefix[prefix]:
+                del by_prefix[prefix]
+            if not by_prefix:
+                del self.prefix_subscribers[len(prefix)]
+        else:
+            self.subscribers.get(flag_or_prefix, []).remove(subscription)
+            if not self.subscribers[flag_or_prefix]:
+                del self.subscribers[flag_or_prefix]
+
+    def _subscriptions_of(self, flag):
+        yield from self.subscribers.get(flag, ())
+        for length, by_prefix in self.prefix_subscribers.items():
+            yield from by_prefix.get(flag[:length], ())
+
+    def update(self, values):
+        """Override the values of flags, subscribers of the changed flags are notified.
+        Changes of one update reach each subscriber as a single call.
+        """
+        for flag in values:
+            if flag not in self.data:
+                raise KeyError(flag)
+
+        if not (self.subscribers or self.prefix_subscribers):
+            self.data.update(values)
+            return
+
+        notify = {}
+        for flag, value in values.items():
+            # get instead of [], reads by settipy itself aren't counted by read stats.
+            if self.data.get(flag) == value:
+                continue
+            self.data[flag] = value
+            for subscription in self._subscriptions_of(flag):
+                notify.setdefault(subscription, {})[flag] = value
+
+        if notify:
+            self._notify(notify)
+
+    def _notify(self, notify):
+        with self.notify_lock:
+            for subscription, changes in notify.items():
+                pending = self.pending_notifications.get(subscription)
+                if pending is not None:
+                    # Not delivered yet, the subscriber receives both changes in one call.
+                    pending.update(changes)
+                    continue
+
+                self.pending_notifications[subscription] = changes
+                try:
+                    self._schedule(subscription)
+                except Exception as e:
+                    # The values are updated already, a closed loop only costs this subscriber its call.
+                    self.pending_notifications.pop(subscription)
+                    if not self.test_mode:
+                        print(f"subscriber {subscription[0]!r} of {sorted(changes)} could not be notified: {e!r}")
+
+    def _schedule(self, subscription):
+        callback, loop = subscription
+        if loop is not None:
+            loop.call_soon_threadsafe(self._deliver, subscription)
+            return
+        if self.notify_executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self.notify_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="settipy")
+        self.notify_executor.submit(self._deliver, subscription)
+
+    def _deliver(self, subscription):
+        with self.notify_lock:
+            changes = self.pending_notifications.pop(subscription)
+        callback, loop = subscription
+        try:
+            callback(changes)
+        except Exception as e:
+            if not self.test_mode:
+                print(f"subscriber {callback!r} of {sorted(changes)} failed: {e!r}")
+
     def _get_env_var(self, flag):
-        return os.environ.get(flag), flag in os.environ
+        key = self.env_prefix + flag
+        return os.environ.get(key), key in os.environ
 
     def _parse_cli(self, pos):
         pos += 1
@@ -158,6 +402,135 @@ class Settipy():
                 self.data_set.add(flag)
                 self.data[flag] = self._cast(value, flag)
 
+    def _handle_env_vars_fast(self):
+        environ, prefix = os.environ, self.env_prefix
+        for flag in self.data.keys():
+            value = environ.get(prefix + flag)
+            if value is not None:
+                self.data_set.add(flag)
+                self.data[flag] = self._cast(value, flag)
+
+    def _handle_cli_vars_fast(self):
+        """One pass over argv instead of a scan of argv for every flag."""
+        positions = {}
+        for pos, arg in enumerate(sys.argv):
+            positions.setdefault(arg, pos)
+
+        for flag in self.data.keys():
+            pos = positions.get("-" + flag)
+            if pos is None:
+                pos = positions.get("--" + flag)
+            if pos is not None:
+                self.data_set.add(flag)
+                self.data[flag] = self._cast(self._parse_cli(pos), flag)
+
+    def _read_handoff(self):
+        """Payload of the blob handed off by the parent, None when there is none."""
+        # Consumed, processes started by the child don't inherit the blob.
+        fd = os.environ.pop(HANDOFF_FD_ENV, None)
+        blob = os.environ.pop(HANDOFF_ENV, None)
+        if fd is None:
+            return None if blob is None else self._check_handoff(blob)
+
+        import stat
+        fd = int(fd)
+        if not stat.S_ISREG(os.fstat(fd).st_mode):
+            raise ValueError(f"descriptor {fd} is not a file")
+        # pread, children sharing the descriptor don't move each other's offset.
+        payload = self._check_handoff(os.pread(fd, os.fstat(fd).st_size, 0).decode())
+        # Only closed once it holds a blob, a descriptor the process uses for something else stays open.
+        os.close(fd)
+        return payload
+
+    def _check_handoff(self, blob):
+        version, _, rest = blob.partition(".")
+        digest, _, payload = rest.partition(".")
+        if version != HANDOFF_VERSION:
+            raise ValueError(f"unsupported version {version!r}")
+        if _digest(payload) != digest:
+            raise ValueError("checksum mismatch")
+        return payload
+
+    def _load_handoff(self, payload):
+        import json
+        import zlib
+        import base64
+        try:
+            content = json.loads(zlib.decompress(base64.urlsafe_b64decode(payload)))
+        except zlib.error as e:
+            raise ValueError(e)
+        if content["schema"] != _digest(repr(tuple(self.data_type.items()))):
+            raise ValueError("exported for different flags")
+
+        self.data.update(content["data"])
+        self.source_flags = content["source_flags"]
+
+    def _handle_handoff(self):
+        try:
+            payload = self._read_handoff()
+            if payload is None:
+                return False
+            self._load_handoff(payload)
+        except (OSError, ValueError, KeyError) as e:
+            if not self.test_mode:
+                print(f"settipy handoff ignored: {e}")
+            return False
+        return True
+
+    def _fetch_sources(self):
+        values = {}
+        for source in reversed(self.sources):
+            values.update(source.fetch(self.source_flags))
+        return values
+
+    def _handle_sources(self):
+        success = True
+        if not self.sources:
+            return success
+
+        self.source_flags = [flag for flag in self.data if flag not in self.data_set]
+        try:
+            values = self._fetch_sources()
+        except (OSError, ValueError) as e:
+            if not self.test_mode:
+                print(f"sources could not be fetched: {e}")
+            return False
+
+        for flag, value in values.items():
+            self.data_set.add(flag)
+            self.data[flag] = self._cast(value, flag)
+        return success
+
+    def _handle_secrets(self):
+        """Password fields with a provider are resolved concurrently,
+        resolving many secrets costs the latency of the slowest one.
+        """
+        success = True
+        pending = {}
+        for flag in self.password_fields:
+            provider = self.secret_providers.get(flag, self.default_secret_provider)
+            if provider is None:
+                continue
+            # Values set by cli or env take precedence, unless the provider combines them.
+            if flag in self.data_set and not provider.overrides:
+                continue
+            pending[flag] = provider
+
+        if not pending:
+            return success
+
+        self.secret_flags = pending
+        results = _run_resolve_secrets(pending)
+        for flag, value in results.items():
+            if isinstance(value, Exception):
+                success = False
+                if not self.test_mode:
+                    print(f"flag: {flag} secret could not be resolved: {value}")
+            elif value is not None:
+                self.data_set.add(flag)
+                self.data[flag] = self._cast(value, flag)
+        return success
+
     def _handle_help(self):
         if "--help" in sys.argv:
             print(f"usage of {sys.argv[0]}")
@@ -208,9 +581,16 @@ class Settipy():
         if not self.options:
             return success
 
-        for flag, allowed_options in self.options.items():
-            value = self.data[flag]
-            if value not in allowed_options:
+        for flag, (allowed_options, per_element) in self.options.items():
+            value = self.data.get(flag)
+            if per_element:
+                # An unset list or dict with a None default has no elements.
+                invalid = set(value or ()) - allowed_options
+                if invalid:
+                    success = False
+                    if not self.test_mode:
+                        print(f"flag: {flag} {sorted(invalid, key=str)}: are not part of allowed options")
+            elif value not in allowed_options:
                 success = False
                 if not self.test_mode:
                     print(f"flag: {flag} {value}: is not part of allowed options")
@@ -225,18 +605,20 @@ class Settipy():
                     print(f"\t-{flag}: {default}")
 
     def _handle_clean(self):
-        self.data_type = None
+        if not (self.sources or self.secret_flags):
+            # Casting is needed to refresh sources and secrets after parse.
+            self.data_type = None
+            self.truthy = None
+            self.list_sep = None
+            self.dict_seps = None
+            self.dict_list_seps = None
         self.messages = None
         self.data_set = None
-        self.truthy = None
-        self.casters = None
-        self.list_sep = None
-        self.dict_seps = None
-        self.dict_list_seps = None
         self.should_be_set = None
         self.conditional_should = None
         self.options = None
-        self.password_fields = None
+        self.secret_providers = None
+        self.default_secret_provider = None
 
     def parse(self, verbose: bool = {}) -> None:
         if verbose:
@@ -246,10 +628,23 @@ class Settipy():
             raise Exception("There is a saying... If you're parsed you can't be parsed again")
 
         self._handle_help()
+        if self._handle_handoff():
+            self._handle_print()
+            self.schema = tuple(self.data_type.items())
+            self._handle_clean()
+            self.parsed = True
+            return
+
         self._handle_print()
-        self._handle_env_vars()
-        self._handle_cli_vars()
-        succeded = self._handle_should()
+        if self.fast_parse:
+            self._handle_env_vars_fast()
+            self._handle_cli_vars_fast()
+        else:
+            self._handle_env_vars()
+            self._handle_cli_vars()
+        succeded = self._handle_sources()
+        succeded = succeded and self._handle_secrets()
+        succeded = succeded and self._handle_should()
         succeded = succeded and self._handle_conditional_should()
         succeded = succeded and self._handle_options()
         if not succeded:
@@ -257,8 +652,383 @@ class Settipy():
                 raise Exception
             sys.exit(1)
 
+        self.schema = tuple(self.data_type.items())
         self._handle_clean()
         self.parsed = True
 
 
-settipy = Settipy()
+def _digest(value):
+    import hashlib
+    return hashlib.sha256(value.encode()).hexdigest()[:32]
+
+
+def _is_handoff_value(value):
+    """Values that come back the same after json, tuples would come back as lists."""
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return True
+    if type(value) is list:
+        return all(_is_handoff_value(item) for item in value)
+    if type(value) is dict:
+        return all(isinstance(key, str) and _is_handoff_value(item) for key, item in value.items())
+    return False
+
+
+class ReadCounter(dict):
+    """Values of settipy while read stats are enabled.
+    Every read is sampled one in `every` times, the first read of a flag is always counted.
+    """
+    def __init__(self, data, every):
+        super().__init__(data)
+        self.every = every
+        # A countdown per flag, a shared one aliases with loops reading flags in turn.
+        self.countdowns = {}
+        self.reads = {}
+
+    def __getitem__(self, key):
+        value = dict.__getitem__(self, key)
+        countdown = self.countdowns.get(key)
+        if countdown is None:
+            self.countdowns[key] = self.every
+            self.reads[key] = 1
+        elif countdown <= 1:
+            self.countdowns[key] = self.every
+            self.reads[key] += self.every
+        else:
+            self.countdowns[key] = countdown - 1
+        return value
+
+
+class Namespace():
+    setters = frozenset({"set", "set_int", "set_bool", "set_list", "set_dict", "set_dict_list"})
+
+    def __init__(self, settipy, name):
+        self.settipy = settipy
+        self.prefix = name + "_"
+
+    def __getattr__(self, name):
+        if name not in self.setters:
+            raise AttributeError(name)
+        setter = getattr(self.settipy, name)
+
+        def prefixed(flag_name, *args, **kwargs):
+            return setter(self.prefix + flag_name, *args, **kwargs)
+        return prefixed
+
+
+class Group():
+    """Values are read from settipy on access, overrides are visible in the group."""
+    __slots__ = ("settipy", "flags")
+
+    def __init__(self, settipy, flags):
+        self.settipy = settipy
+        self.flags = flags
+
+    def __getitem__(self, key):
+        if key not in self.flags:
+            raise KeyError(key)
+        return self.settipy.data[key]
+
+    def __contains__(self, key):
+        return key in self.flags
+
+    def __iter__(self):
+        return iter(self.flags)
+
+    def __len__(self):
+        return len(self.flags)
+
+    def get(self, key, default=None):
+        return self[key] if key in self.flags else default
+
+    def keys(self):
+        return self.flags.keys()
+
+    def values(self):
+        return [self[key] for key in self.flags]
+
+    def items(self):
+        return [(key, self[key]) for key in self.flags]
+
+
+class RemoteSource():
+    """Values from a http key-value service, fetched with one request for all flags.
+    `GET <url>?keys=A,B` is answered with a json object of flag to value.
+    The connection is kept alive between fetches, refreshes are conditional on the ETag.
+    When the service is unreachable or answers invalid json the copy stored at cache_path is used.
+    """
+    def __init__(self, url, timeout=2.0, cache_path=None):
+        from urllib.parse import urlsplit
+        self.url = urlsplit(url)
+        self.timeout = timeout
+        self.cache_path = cache_path
+        self.connection = None
+        self.responses = {}
+        self.test_mode = False
+
+    def close(self):
+        """Release the kept alive connection, a later fetch connects again."""
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def _connect(self, timeout):
+        if self.connection is None:
+            import http.client
+            if self.url.scheme == "https":
+                connection_class = http.client.HTTPSConnection
+            else:
+                connection_class = http.client.HTTPConnection
+            self.connection = connection_class(self.url.hostname, self.url.port, timeout=timeout)
+        self.connection.timeout = timeout
+        if self.connection.sock is not None:
+            self.connection.sock.settimeout(timeout)
+        return self.connection
+
+    def _get(self, path):
+        import http.client
+        deadline = time.monotonic() + self.timeout
+        etag, values = self.responses.get(path, (None, None))
+        headers = {"If-None-Match": etag} if etag else {}
+
+        # A kept alive connection can be closed by the service in between fetches, retry once.
+        for retry in (True, False):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"{self.url.geturl()} did not answer within {self.timeout}s")
+            connection = self._connect(remaining)
+            try:
+                connection.request("GET", path, headers=headers)
+                response = connection.getresponse()
+                body = response.read()
+                break
+            except (ConnectionError, http.client.HTTPException) as e:
+                connection.close()
+                if not retry:
+                    raise ConnectionError(f"{self.url.geturl()} closed the connection") from e
+            except OSError:
+                connection.close()
+                raise
+
+        if response.status == 304 and values is not None:
+            return values, False
+        if response.status != 200:
+            raise ConnectionError(f"{self.url.geturl()} answered {response.status}")
+
+        values = self._decode(body)
+        self.responses[path] = response.getheader("ETag"), values
+        return values, True
+
+    def _decode(self, body):
+        import json
+        values = json.loads(body)
+        if not isinstance(values, dict):
+            raise ValueError(f"{self.url.geturl()} answered {type(values).__name__}, expected an object")
+        for flag, value in values.items():
+            # Values are cast like cli and env input, json true or lists would be cast wrong.
+            if not isinstance(value, str):
+                raise ValueError(f"{self.url.geturl()} answered {value!r} for {flag}, values should be strings")
+        return values
+
+    def _load_copy(self):
+        import json
+        with open(self.cache_path) as fh:
+            return json.load(fh)
+
+    def _store_copy(self, values):
+        import json
+        try:
+            copy = self._load_copy()
+        except (OSError, ValueError):
+            copy = {}
+        copy.update(values)
+        tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as fh:
+            json.dump(copy, fh)
+        os.replace(tmp_path, self.cache_path)
+
+    def fetch(self, flags):
+        from urllib.parse import parse_qsl, urlencode
+        query = [(k, v) for k, v in parse_qsl(self.url.query, keep_blank_values=True) if k != "keys"]
+        query.append(("keys", ",".join(flags)))
+        path = f"{self.url.path or '/'}?{urlencode(query)}"
+        try:
+            values, modified = self._get(path)
+        except (OSError, ValueError):
+            if self.cache_path is None or not os.path.exists(self.cache_path):
+                raise
+            values = self._load_copy()
+        else:
+            if modified and self.cache_path is not None:
+                try:
+                    self._store_copy(values)
+                except OSError as e:
+                    if not self.test_mode:
+                        print(f"copy of {self.url.geturl()} could not be stored at {self.cache_path}: {e}")
+        return {flag: values[flag] for flag in flags if flag in values}
+
+
+class SecretProvider():
+    """Base class for password field sources.
+    Subclasses implement `_fetch`, returning the value or None when unknown.
+    Values are cached for `ttl` seconds, once an entry is within the last
+    `refresh_ahead` fraction of its ttl it's refreshed in the background
+    while the cached value is served.
+    """
+    # Providers that override, instead of follow, values set by cli or env.
+    overrides = False
+
+    def __init__(self, ttl=300.0, refresh_ahead=0.2):
+        self.ttl = ttl
+        self.refresh_ahead = refresh_ahead
+        self.clock = time.monotonic
+        self._cache = {}
+        self._inflight = {}
+
+    async def _fetch(self, flag):
+        raise NotImplementedError
+
+    async def get(self, flag):
+        entry = self._cache.get(flag)
+        if entry is not None:
+            value, expires = entry
+            remaining = expires - self.clock()
+            if remaining > 0:
+                if remaining <= self.ttl * self.refresh_ahead:
+                    self._refresh(flag, background=True)
+                return value
+        return await self._refresh(flag)
+
+    def _refresh(self, flag, background=False):
+        import asyncio
+        task = self._inflight.get(flag)
+        if task is None or task.get_loop() is not asyncio.get_running_loop():
+            task = asyncio.ensure_future(self._load(flag))
+            self._inflight[flag] = task
+            if background:
+                # Nobody awaits a background refresh, the cached value is served until it expires.
+                task.add_done_callback(lambda task: self._report_refresh(flag, task))
+        return task
+
+    def _report_refresh(self, flag, task):
+        if not task.cancelled() and task.exception() is not None:
+            print(f"flag: {flag} secret could not be refreshed: {task.exception()!r}")
+
+    async def _load(self, flag):
+        try:
+            value = await self._fetch(flag)
+            self._cache[flag] = value, self.clock() + self.ttl
+            return value
+        finally:
+            self._inflight.pop(flag, None)
+
+    async def wait_refreshed(self):
+        import asyncio
+        if self._inflight:
+            await asyncio.gather(*self._inflight.values(), return_exceptions=True)
+
+
+class FileSecretProvider(SecretProvider):
+    """Reads the secret of a flag from the file `directory/flag`, e.g. /run/secrets."""
+    def __init__(self, directory, ttl=300.0, refresh_ahead=0.2):
+        super().__init__(ttl, refresh_ahead)
+        self.directory = directory
+
+    def _read(self, flag):
+        try:
+            with open(os.path.join(self.directory, flag)) as fh:
+                return fh.read().rstrip("\n")
+        except FileNotFoundError:
+            return None
+
+    async def _fetch(self, flag):
+        import asyncio
+        return await asyncio.get_running_loop().run_in_executor(None, self._read, flag)
+
+
+class AgentSecretProvider(SecretProvider):
+    """Asks a secret agent listening on a Unix socket.
+    The agent answers the line `GET <flag>` with `OK <value>` or `NOTFOUND`.
+    """
+    def __init__(self, path, timeout=5.0, ttl=300.0, refresh_ahead=0.2):
+        super().__init__(ttl, refresh_ahead)
+        self.path = path
+        self.timeout = timeout
+
+    async def _ask(self, flag):
+        import asyncio
+        reader, writer = await asyncio.open_unix_connection(self.path)
+        try:
+            writer.write(f"GET {flag}\n".encode())
+            await writer.drain()
+            return (await reader.readline()).decode().rstrip("\n")
+        finally:
+            writer.close()
+            await writer.wait_closed()
+
+    async def _fetch(self, flag):
+        import asyncio
+        line = await asyncio.wait_for(self._ask(flag), self.timeout)
+        status, _, value = line.partition(" ")
+        if status == "OK":
+            return value
+        if status == "NOTFOUND":
+            return None
+        raise ValueError(f"unexpected reply from secret agent: {line!r}")
+
+
+class SplitSecretProvider(SecretProvider):
+    """Secret splitting, the first part of the secret is set as environment
+    variable and the second part on the command line under the same flag.
+    An attacker needs both the environment and the process arguments.
+    """
+    overrides = True
+
+    def __init__(self, settipy, ttl=300.0, refresh_ahead=0.2):
+        super().__init__(ttl, refresh_ahead)
+        self.settipy = settipy
+
+    async def _fetch(self, flag):
+        env_part, env_found = self.settipy._get_env_var(flag)
+        cli_part, cli_found = self.settipy._get_cli_var(flag)
+        if not env_found and not cli_found:
+            return None
+        if not (env_found and cli_found):
+            raise ValueError("only one part of the split secret is set")
+        return env_part + cli_part
+
+
+async def _resolve_secrets(pending):
+    import asyncio
+    flags = list(pending)
+    values = await asyncio.gather(*(pending[flag].get(flag) for flag in flags), return_exceptions=True)
+    return dict(zip(flags, values))
+
+
+def _run_resolve_secrets(pending):
+    import asyncio
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(_resolve_secrets(pending))
+
+    # parse called from async code, resolve on a thread with its own loop.
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, _resolve_secrets(pending)).result()
+
+
+# importlib.reload keeps the module namespace, drop the instance of the previous load.
+globals().pop("settipy", None)
+
+__all__ = [  # noqa: settipy is created by __getattr__
+    "settipy", "Settipy", "ReadCounter", "Namespace", "Group", "RemoteSource",
+    "SecretProvider", "FileSecretProvider", "AgentSecretProvider", "SplitSecretProvider",
+]
+
+
+def __getattr__(name):
+    """The global settipy instance is created on first access, importing is free."""
+    if name == "settipy":
+        instance = globals()["settipy"] = Settipy()
+        return instance
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
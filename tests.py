@@ -1,11 +1,22 @@
+import io
 import os
 import sys
+import time
+import json
+import asyncio
+import tempfile
+import threading
+import http.server
+import subprocess
+import socketserver
 
 import unittest
 from unittest import mock
+from urllib.parse import urlsplit, parse_qs
 
 import importlib
 
+import fuzz
 import settipy
 
 
@@ -198,6 +209,66 @@ class TestFeatures(unittest.TestCase):
                 with self.assertRaises(Exception):
                     setpy.parse()
 
+    def test_list_should_be_of_options(self):
+        setpy = settipy.settipy
+        setpy.test_mode = True
+
+        patched_argv = ["./foo.py", "--REGIONS", "eu,us,mars"]
+
+        with mock.patch.object(sys, "argv", patched_argv):
+            with mock.patch.dict(os.environ, {}, clear=True):
+                setpy.set_list("REGIONS", ["eu"], "regions", options=["eu", "us", "asia"])
+
+                with self.assertRaises(Exception):
+                    setpy.parse()
+
+    def test_happy_path_list_of_options(self):
+        setpy = settipy.settipy
+        setpy.test_mode = True
+
+        patched_argv = ["./foo.py", "--REGIONS", "eu,us"]
+        patched_environ = {"LIMITS": "eu:1;asia:2"}
+
+        with mock.patch.object(sys, "argv", patched_argv):
+            with mock.patch.dict(os.environ, patched_environ, clear=True):
+                setpy.set_list("REGIONS", ["eu"], "regions", options=["eu", "us", "asia"])
+                setpy.set_dict("LIMITS", {}, "limits per region", options=["eu", "us", "asia"])
+                setpy.set_dict_list("ZONES", {"eu": ["a"]}, "zones per region", options=["eu", "us"])
+                setpy.parse()
+
+                self.assertEqual(["eu", "us"], setpy["REGIONS"])
+                self.assertEqual({"eu": "1", "asia": "2"}, setpy["LIMITS"])
+
+    def test_list_of_options_none_default(self):
+        setpy = settipy.settipy
+        setpy.test_mode = True
+
+        with mock.patch.object(sys, "argv", ["./foo.py"]):
+            with mock.patch.dict(os.environ, {}, clear=True):
+                setpy.set_list("REGIONS", None, "regions", options=["eu", "us"])
+                setpy.set_dict("LIMITS", None, "limits per region", options=["eu", "us"])
+                setpy.parse()
+
+                self.assertIsNone(setpy["REGIONS"])
+                self.assertIsNone(setpy["LIMITS"])
+
+    def test_options_report_all_invalid(self):
+        setpy = settipy.settipy
+
+        patched_argv = ["./foo.py", "--REGIONS", "mars,eu,venus", "--LIMITS", "moon:1;eu:2"]
+
+        with mock.patch.object(sys, "argv", patched_argv):
+            with mock.patch.dict(os.environ, {}, clear=True):
+                setpy.set_list("REGIONS", ["eu"], "regions", options=["eu", "us"])
+                setpy.set_dict("LIMITS", {}, "limits per region", options=["eu", "us"])
+
+                with mock.patch("sys.stdout", new_callable=io.StringIO) as stdout:
+                    with self.assertRaises(SystemExit):
+                        setpy.parse()
+
+                self.assertIn("flag: REGIONS ['mars', 'venus']: are not part of allowed options", stdout.getvalue())
+                self.assertIn("flag: LIMITS ['moon']: are not part of allowed options", stdout.getvalue())
+
     def test_happy_path_multiple(self):
         setpy = settipy.settipy
         setpy.test_mode = True
@@ -481,6 +552,993 @@ class TestTypes(unittest.TestCase):
                 self.assertDictEqual(expected_dict, setpy["e"])
                 self.assertDictEqual(expected_dict_list, setpy["f"])
 
+    def test_subclass_caster(self):
+        class HexSettipy(settipy.Settipy):
+            def _to_int(self, v, flag):
+                return int(v, 0)
+
+        setpy = HexSettipy()
+        setpy.test_mode = True
+
+        with mock.patch.object(sys, "argv", ["./foo.py", "-a", "0x10"]):
+            with mock.patch.dict(os.environ, {}, clear=True):
+                setpy.set_int("a", 2, "msg a")
+                setpy.parse()
+
+                self.assertEqual(16, setpy["a"])
+
+    def test_extend_truthy(self):
+        setpy = settipy.Settipy()
+        setpy.test_mode = True
+        setpy.truthy.add("1")
+
+        with mock.patch.object(sys, "argv", ["./foo.py", "-a", "1"]):
+            with mock.patch.dict(os.environ, {}, clear=True):
+                setpy.set_bool("a", False, "msg a")
+                setpy.parse()
+
+                self.assertTrue(setpy["a"])
+        self.assertNotIn("1", settipy.Settipy().truthy)
+
+
+class SecretAgentHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+        try:
+            command, _, flag = self.rfile.readline().decode().rstrip("\n").partition(" ")
+            time.sleep(server.delay)
+            if flag in server.secrets:
+                reply = f"OK {server.secrets[flag]}\n"
+            else:
+                reply = "NOTFOUND\n"
+            self.wfile.write(reply.encode())
+        finally:
+            with server.lock:
+                server.active -= 1
+
+
+class SecretAgent(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 64
+
+    def __init__(self, path, secrets, delay=0.0):
+        super().__init__(path, SecretAgentHandler)
+        self.secrets = secrets
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+
+
+class CountingProvider(settipy.SecretProvider):
+    def __init__(self, ttl=300.0, refresh_ahead=0.2):
+        super().__init__(ttl, refresh_ahead)
+        self.fetched = 0
+        self.now = 0.0
+        self.clock = lambda: self.now
+
+    async def _fetch(self, flag):
+        self.fetched += 1
+        return f"{flag}-{self.fetched}"
+
+
+class TestSecrets(unittest.TestCase):
+
+    def setUp(self):
+        importlib.reload(settipy)
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def start_agent(self, secrets, delay=0.0):
+        agent = SecretAgent(os.path.join(self.tmp.name, "agent.sock"), secrets, delay)
+        threading.Thread(target=agent.serve_forever, args=(0.05,), daemon=True).start()
+        self.addCleanup(agent.server_close)
+        self.addCleanup(agent.shutdown)
+        return agent
+
+    def test_file_provider(self):
+        setpy = settipy.settipy
+        setpy.test_mode = True
+
+        with open(os.path.join(self.tmp.name, "DB_PASS"), "w") as fh:
+            fh.write("from-file\n")
+
+        with mock.patch.object(sys, "argv", ["./foo.py"]):
+            with mock.patch.dict(os.environ, {}, clear=True):
+                setpy.set("DB_PASS", "dev", "db password", password=True)
+                setpy.set("OTHER_PASS", "dev", "other password", password=True)
+                setpy.set_secret_provider(settipy.FileSecretProvider(self.tmp.name))
+                setpy.parse()
+
+                self.assertEqual("from-file", setpy["DB_PASS"])
+                self.assertEqual("dev", setpy["OTHER_PASS"])
+
+    def test_agent_provider_concurrent(self):
+        setpy = settipy.settipy
+        setpy.test_mode = True
+
+        flags = [f"PASS_{i}" for i in range(20)]
+        agent = self.start_agent({flag: flag.lower() for flag in flags}, delay=0.1)
+
+        with mock.patch.object(sys, "argv", ["./foo.py"]):
+            with mock.patch.dict(os.environ, {}, clear=True):
+                for flag in flags:
+                    setpy.set(flag, "", "password", password=True)
+                setpy.set_secret_provider(settipy.AgentSecretProvider(agent.server_address))
+
+                start = time.monotonic()
+                setpy.parse()
+                elapsed = time.monotonic() - start
+
+                for flag in flags:
+                    self.assertEqual(flag.lower(), setpy[flag])
+                self.assertGreater(agent.max_active, 1)
+                self.assertLess(elapsed, 20 * 0.1)
+
+    def test_agent_provider_unreachable(self):
+        setpy = settipy.settipy
+        setpy.test_mode = True
+
+        with mock.patch.object(sys, "argv", ["./foo.py"]):
+            with mock.patch.dict(os.environ, {}, clear=True):
+                setpy.set("DB_PASS", "dev", "db password", password=True)
+                provider = settipy.AgentSecretProvider(os.path.join(self.tmp.name, "missing.sock"))
+                setpy.set_secret_provider(provider, flags=["DB_PASS"])
+
+                with self.assertRaises(Exception):
+                    setpy.parse()
+
+    def test_split_provider(self):
+        setpy = settipy.settipy
+        setpy.test_mode = True
+
+        patched_argv = ["./foo.py", "--DB_PASS", "second-half"]
+        patched_environ = {"DB_PASS": "first-half-"}
+
+        with mock.patch.object(sys, "argv", patched_argv):
+            with mock.patch.dict(os.environ, patched_environ, clear=True):
+                setpy.set("DB_PASS", "dev", "db password", password=True)
+                setpy.set_secret_provider(settipy.SplitSecretProvider(setpy))
+                setpy.parse()
+
+                self.assertEqual("first-half-second-half", setpy["DB_PASS"])
+
+    def test_split_provider_one_part(self):
+        setpy = settipy.settipy
+        setpy.test_mode = True
+
+        with mock.patch.object(sys, "argv", ["./foo.py"]):
+            with mock.patch.dict(os.environ, {"DB_PASS": "first-half-"}, clear=True):
+                setpy.set("DB_PASS", "dev", "db password", password=True)
+                setpy.set_secret_provider(settipy.SplitSecretProvider(setpy))
+
+                with self.assertRaises(Exception):
+                    setpy.parse()
+
+    def test_ttl_cache(self):
+        provider = CountingProvider(ttl=10.0, refresh_ahead=0.2)
+
+        async def get():
+            value = await provider.get("FOO")
+            await provider.wait_refreshed()
+            return value
+
+        self.assertEqual("FOO-1", asyncio.run(get()))
+        provider.now = 5.0
+        self.assertEqual("FOO-1", asyncio.run(get()))
+        self.assertEqual(1, provider.fetched)
+
+        # Within the refresh ahead window the cached value is served and refreshed.
+        provider.now = 9.0
+        self.assertEqual("FOO-1", asyncio.run(get()))
+        self.assertEqual(2, provider.fetched)
+        self.assertEqual("FOO-2", asyncio.run(get()))
+
+        # Expired entries are fetched before returning.
+        provider.now = 100.0
+        self.assertEqual("FOO-3", asyncio.run(get()))
+
+    def test_failing_refresh_ahead_reported(self):
+        provider = CountingProvider(ttl=10.0, refresh_ahead=0.2)
+        fetch = provider._fetch
+
+        async def failing_fetch(flag):
+            if provider.fetched:
+                raise OSError("agent went away")
+            return await fetch(flag)
+        provider._fetch = failing_fetch
+
+        async def main():
+            first = await provider.get("FOO")
+            provider.now = 9.0
+            with mock.patch("sys.stdout", new_callable=io.StringIO) as stdout:
+                cached = await provider.get("FOO")
+                await provider.wait_refreshed()
+                await asyncio.sleep(0)
+            return first, cached, stdout.getvalue()
+
+        first, cached, output = asyncio.run(main())
+        self.assertEqual("FOO-1", first)
+        self.assertEqual("FOO-1", cached)
+        self.assertIn("flag: FOO secret could not be refreshed: OSError('agent went away')", output)
+
+    def test_provider_follows_cli_and_env(self):
+        setpy = settipy.settipy
+        setpy.test_mode = True
+
+        for flag in ("DB_PASS", "CLI_PASS", "ENV_PASS"):
+            with open(os.path.join(self.tmp.name, flag), "w") as fh:
+                fh.write("from-file")
+
+        patched_argv = ["./foo.py", "--CLI_PASS", "from-cli"]
+        patched_environ = {"ENV_PASS": "from-env"}
+
+        with mock.patch.object(sys, "argv", patched_argv):
+            with mock.patch.dict(os.environ, patched_environ, clear=True):
+                setpy.set("DB_PASS", "dev", "db password", password=True)
+                setpy.set("CLI_PASS", "dev", "cli password", password=True)
+                setpy.set("ENV_PASS", "dev", "env password", password=True)
+                setpy.set_secret_provider(settipy.FileSecretProvider(self.tmp.name))
+                setpy.parse()
+
+                self.assertEqual("from-file", setpy["DB_PASS"])
+                self.assertEqual("from-cli", setpy["CLI_PASS"])
+                self.assertEqual("from-env", setpy["ENV_PASS"])
+
+    def test_parse_in_running_loop(self):
+        setpy = settipy.settipy
+        setpy.test_mode = True
+
+        with open(os.path.join(self.tmp.name, "DB_PASS"), "w") as fh:
+            fh.write("from-file")
+
+        async def main():
+            setpy.set("DB_PASS", "dev", "db password", password=True)
+            setpy.set_secret_provider(settipy.FileSecretProvider(self.tmp.name))
+            setpy.parse()
+
+        with mock.patch.object(sys, "argv", ["./foo.py"]):
+            with mock.patch.dict(os.environ, {}, clear=True):
+                asyncio.run(main())
+        self.assertEqual("from-file", setpy["DB_PASS"])
+
+    def test_refresh_secrets(self):
+        setpy = settipy.settipy
+        setpy.test_mode = True
+        provider = CountingProvider(ttl=10.0, refresh_ahead=0.2)
+
+        with mock.patch.object(sys, "argv", ["./foo.py"]):
+            with mock.patch.dict(os.environ, {}, clear=True):
+                setpy.set("DB_PASS", "dev", "db password", password=True)
+                setpy.set_secret_provider(provider)
+                setpy.parse()
+        self.assertEqual("DB_PASS-1", setpy["DB_PASS"])
+
+        async def main():
+            # Fresh, served from the cache.
+            provider.now = 5.0
+            await setpy.refresh_secrets()
+            self.assertEqual(1, provider.fetched)
+
+            # Close to expiry, the cached value is served while refreshing in the background.
+            provider.now = 9.0
+            await setpy.refresh_secrets()
+            self.assertEqual("DB_PASS-1", setpy["DB_PASS"])
+            await provider.wait_refreshed()
+            self.assertEqual(2, provider.fetched)
+
+            await setpy.refresh_secrets()
+            self.assertEqual("DB_PASS-2", setpy["DB_PASS"])
+
+        asyncio.run(main())
+
+
+class ConfigServiceHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        server.requests += 1
+        server.path = self.path
+        time.sleep(server.delay)
+        if server.body is not None:
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(server.body)))
+            self.end_headers()
+            self.wfile.write(server.body)
+            return
+        keys = parse_qs(urlsplit(self.path).query)["keys"][0].split(",")
+        body = json.dumps({key: server.values[key] for key in keys if key in server.values}).encode()
+        etag = f'"{hash(body)}"'
+        if self.headers.get("If-None-Match") == etag:
+            server.not_modified += 1
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class ConfigService(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, values, delay=0.0):
+        super().__init__(("127.0.0.1", 0), ConfigServiceHandler)
+        self.values = values
+        self.delay = delay
+        self.body = None
+        self.path = None
+        self.connections = 0
+        self.requests = 0
+        self.not_modified = 0
+
+    def handle_error(self, request, client_address):
+        pass
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/config"
+
+
+class TestRemoteSource(unittest.TestCase):
+
+    def setUp(self):
+        importlib.reload(settipy)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.cache_path = os.path.join(self.tmp.name, "config.json")
+
+    def start_service(self, values, delay=0.0):
+        service = ConfigService(values, delay)
+        threading.Thread(target=service.serve_forever, args=(0.05,), daemon=True).start()
+        self.addCleanup(service.server_close)
+        self.addCleanup(service.shutdown)
+        return service
+
+    def source(self, url, **kwargs):
+        source = settipy.RemoteSource(url, **kwargs)
+        self.addCleanup(source.close)
+        return source
+
+    def test_remote_source(self):
+        setpy = settipy.settipy
+        setpy.test_mode = True
+
+        service = self.start_service({"DB_HOST": "db", "DB_PORT": "6543", "REGIONS": "eu,us", "TOPIC": "remote"})
+        patched_argv = ["./foo.py", "--TOPIC", "cli"]
+
+        with mock.patch.object(sys, "argv", patched_argv):
+            with mock.patch.dict(os.environ, {}, clear=True):
+                setpy.set("DB_HOST", "localhost", "db host")
+                setpy.set_int("DB_PORT", 5432, "db port")
+                setpy.set_list("REGIONS", [], "regions")
+                setpy.set("TOPIC", "default", "topic")
+                setpy.set("CACHE_HOST", "localhost", "cache host")
+                setpy.add_source(self.source(service.url))
+                setpy.parse()
+
+                self.assertEqual("db", setpy["DB_HOST"])
+                self.assertEqual(6543, setpy["DB_PORT"])
+                self.assertEqual(["eu", "us"], setpy["REGIONS"])
+                self.assertEqual("cli", setpy["TOPIC"])
+                self.assertEqual("localhost", setpy["CACHE_HOST"])
+        self.assertEqual(1, service.requests)
+
+    def test_refresh_conditional_keep_alive(self):
+        setpy = settipy.settipy
+        setpy.test_mode = True
+
+        service = self.start_service({"DB_PORT": "6543"})
+
+        with mock.patch.object(sys, "argv", ["./foo.py"]):
+            with mock.patch.dict(os.environ, {}, clear=True):
+                setpy.set_int("DB_PORT", 5432, "db port")
+                setpy.add_source(self.source(service.url))
+                setpy.parse()
+
+        changes = []
+        setpy.subscribe("DB_PORT", changes.append)
+
+        setpy.refresh()
+        self.assertEqual(1, service.not_modified)
+
+        service.values["DB_PORT"] = "7654"
+        setpy.refresh()
+        setpy.notify_executor.shutdown(wait=True)
+
+        self.assertEqual(7654, setpy["DB_PORT"])
+        self.assertEqual([{"DB_PORT": 7654}], changes)
+        self.assertEqual(3, service.requests)
+        self.assertEqual(1, service.connections)
+
+    def test_fallback_to_copy(self):
+        service = self.start_service({"DB_HOST": "db"})
+        source = self.source(service.url, cache_path=self.cache_path)
+        self.assertEqual({"DB_HOST": "db"}, source.fetch(["DB_HOST", "DB_PORT"]))
+
+        service.shutdown()
+        service.server_close()
+
+        setpy = settipy.settipy
+        setpy.test_mode = True
+        with mock.patch.object(sys, "argv", ["./foo.py"]):
+            with mock.patch.dict(os.environ, {}, clear=True):
+                setpy.set("DB_HOST", "localhost", "db host")
+                setpy.add_source(self.source(service.url, cache_path=self.cache_path))
+                setpy.parse()
+
+                self.assertEqual("db", setpy["DB_HOST"])
+
+    def test_timeout(self):
+        service = self.start_service({"DB_HOST": "db"}, delay=1.0)
+        source = self.source(service.url, timeout=0.2)
+
+        start = time.monotonic()
+        with self.assertRaises(OSError):
+            source.fetch(["DB_HOST"])
+        self.assertLess(time.monotonic() - start, 1.0)
+
+    def test_unreachable(self):
+        service = self.start_service({})
+        url = service.url
+        service.shutdown()
+        service.server_close()
+
+        setpy = settipy.settipy
+        setpy.test_mode = True
+        with mock.patch.object(sys, "argv", ["./foo.py"]):
+            with mock.patch.dict(os.environ, {}, clear=True):
+                setpy.set("DB_HOST", "localhost", "db host")
+                setpy.add_source(self.source(url))
+
+                with self.assertRaises(Exception):
+                    setpy.parse()
+
+    def test_non_string_values(self):
+        setpy = settipy.settipy
+        setpy.test_mode = True
+
+        service = self.start_service({"DEBUG": True, "REGIONS": ["eu", "us"]})
+
+        with mock.patch.object(sys, "argv", ["./foo.py"]):
+            with mock.patch.dict(os.environ, {}, clear=True):
+                setpy.set_bool("DEBUG", False, "debug")
+                setpy.set_list("REGIONS", [], "regions")
+                setpy.add_source(self.source(service.url))
+
+                with self.assertRaises(Exception):
+                    setpy.parse()
+
+        with self.assertRaisesRegex(ValueError, "values should be strings"):
+            self.source(service.url).fetch(["DEBUG"])
+
+    def test_copy_not_stored(self):
+        setpy = settipy.settipy
+        setpy.test_mode = True
+
+        service = self.start_service({"DB_HOST": "db"})
+        cache_path = os.path.join(self.tmp.name, "missing", "config.json")
+
+        with mock.patch.object(sys, "argv", ["./foo.py"]):
+            with mock.patch.dict(os.environ, {}, clear=True):
+                setpy.set("DB_HOST", "localhost", "db host")
+                setpy.add_source(self.source(service.url, cache_path=cache_path))
+                with mock.patch("sys.stdout", new_callable=io.StringIO) as stdout:
+                    setpy.parse()
+
+                self.assertEqual("db", setpy["DB_HOST"])
+                self.assertIn("could not be stored", stdout.getvalue())
+
+        source = self.source(service.url, cache_path=cache_path)
+        source.test_mode = True
+        with mock.patch("sys.stdout", new_callable=io.StringIO) as stdout:
+            self.assertEqual({"DB_HOST": "db"}, source.fetch(["DB_HOST"]))
+        self.assertEqual("", stdout.getvalue())
+
+    def test_url_query(self):
+        service = self.start_service({"DB_HOST": "db"})
+        source = self.source(f"{service.url}?env=prd&keys=ignored")
+
+        self.assertEqual({"DB_HOST": "db"}, source.fetch(["DB_HOST"]))
+        self.assertEqual({"env": ["prd"], "keys": ["DB_HOST"]}, parse_qs(urlsplit(service.path).query))
+
+    def test_invalid_json(self):
+        service = self.start_service({"DB_HOST": "db"})
+        self.assertEqual({"DB_HOST": "db"}, self.source(service.url, cache_path=self.cache_path).fetch(["DB_HOST"]))
+
+        service.body = b"<html>maintenance</html>"
+        with self.assertRaises(ValueError):
+            self.source(service.url).fetch(["DB_HOST"])
+
+        setpy = settipy.settipy
+        setpy.test_mode = True
+        with mock.patch.object(sys, "argv", ["./foo.py"]):
+            with mock.patch.dict(os.environ, {}, clear=True):
+                setpy.set("DB_HOST", "localhost", "db host")
+                setpy.add_source(self.source(service.url, cache_path=self.cache_path))
+                setpy.parse()
+
+                self.assertEqual("db", setpy["DB_HOST"])
+
+
+class TestGroups(unittest.TestCase):
+
+    def setUp(self):
+        importlib.reload(settipy)
+
+    def test_group(self):
+        setpy = settipy.settipy
+
+        patched_environ = {"DB_HOST": "db", "KAFKA_CONSUMER_GROUP": "workers"}
+
+        with mock.patch.object(sys, "argv", ["./foo.py"]):
+            with mock.patch.dict(os.environ, patched_environ, clear=True):
+                setpy.set("DB_HOST", "localhost", "db host")
+                setpy.set_int("DB_PORT", 5432, "db port")
+                setpy.set("DBX", "", "not part of DB")
+                setpy.set("KAFKA_CONSUMER_GROUP", "", "consumer group")
+                setpy.set("KAFKA_TOPIC", "", "topic")
+                setpy.parse()
+
+                db = setpy.group("DB")
+                self.assertEqual({"DB_HOST": "db", "DB_PORT": 5432}, dict(db.items()))
+                self.assertEqual(["DB_HOST", "DB_PORT"], list(db))
+                self.assertEqual(2, len(db))
+                self.assertNotIn("DBX", db)
+                with self.assertRaises(KeyError):
+                    db["DBX"]
+                with self.assertRaises(TypeError):
+                    db["DB_HOST"] = "changed"
+
+                self.assertEqual(["KAFKA_CONSUMER_GROUP"], list(setpy.group("KAFKA_CONSUMER")))
+                self.assertEqual(2, len(setpy.group("KAFKA")))
+                self.assertEqual(0, len(setpy.group("CACHE")))
+
+                setpy["DB_PORT"] = 6543
+                self.assertEqual(6543, db["DB_PORT"])
+
+    def test_group_before_registration(self):
+        setpy = settipy.settipy
+        db = setpy.group("DB")
+
+        with mock.patch.object(sys, "argv", ["./foo.py"]):
+            with mock.patch.dict(os.environ, {}, clear=True):
+                setpy.set("DB_HOST", "localhost", "db host")
+                setpy.parse()
+
+                self.assertEqual({"DB_HOST": "localhost"}, dict(db.items()))
+
+    def test_namespace(self):
+        setpy = settipy.settipy
+
+        patched_argv = ["./foo.py", "--DB_PORT", "6543"]
+
+        with mock.patch.object(sys, "argv", patched_argv):
+            with mock.patch.dict(os.environ, {}, clear=True):
+                db = setpy.namespace("DB")
+                db.set("HOST", "localhost", "db host")
+                db.set_int("PORT", 5432, "db port")
+                setpy.parse()
+
+                self.assertEqual({"DB_HOST": "localhost", "DB_PORT": 6543}, dict(setpy.group("DB").items()))
+                with self.assertRaises(AttributeError):
+                    db.parse
+
+    def test_env_prefix(self):
+        setpy = settipy.settipy
+        setpy.env_prefix = "APP_"
+
+        patched_environ = {"APP_DB_HOST": "db", "DB_PORT": "6543"}
+
+        with mock.patch.object(sys, "argv", ["./foo.py"]):
+            with mock.patch.dict(os.environ, patched_environ, clear=True):
+                setpy.set("DB_HOST", "localhost", "db host")
+                setpy.set_int("DB_PORT", 5432, "db port")
+                setpy.parse()
+
+                self.assertEqual("db", setpy["DB_HOST"])
+                self.assertEqual(5432, setpy["DB_PORT"])
+
+
+class TestSubscribe(unittest.TestCase):
+
+    def setUp(self):
+        importlib.reload(settipy)
+        self.setpy = settipy.settipy
+        with mock.patch.object(sys, "argv", ["./foo.py"]):
+            with mock.patch.dict(os.environ, {}, clear=True):
+                self.setpy.set("DB_HOST", "localhost", "db host")
+                self.setpy.set_int("DB_PORT", 5432, "db port")
+                self.setpy.set("CACHE_HOST", "localhost", "cache host")
+                self.setpy.parse()
+
+    def collect(self):
+        calls = []
+        called = threading.Event()
+
+        def callback(changes):
+            calls.append(changes)
+            called.set()
+        return callback, calls, called
+
+    def test_subscribe_flag(self):
+        callback, calls, called = self.collect()
+        self.setpy.subscribe("DB_HOST", callback)
+
+        self.setpy["CACHE_HOST"] = "cache"
+        self.setpy["DB_HOST"] = "db"
+
+        self.assertTrue(called.wait(5))
+        self.assertEqual([{"DB_HOST": "db"}], calls)
+        self.assertEqual("db", self.setpy["DB_HOST"])
+        self.assertEqual("cache", self.setpy["CACHE_HOST"])
+
+    def test_subscribe_prefix_coalesced(self):
+        callback, calls, called = self.collect()
+        self.setpy.subscribe("DB_*", callback)
+
+        self.setpy.update({"DB_HOST": "db", "DB_PORT": 6543, "CACHE_HOST": "cache"})
+
+        self.assertTrue(called.wait(5))
+        self.assertEqual([{"DB_HOST": "db", "DB_PORT": 6543}], calls)
+
+    def test_unchanged_value_not_notified(self):
+        callback, calls, called = self.collect()
+        self.setpy.subscribe("DB_*", callback)
+
+        self.setpy["DB_HOST"] = "localhost"
+        self.setpy["DB_PORT"] = 1
+
+        self.assertTrue(called.wait(5))
+        self.assertEqual([{"DB_PORT": 1}], calls)
+
+    def test_unsubscribe(self):
+        callback, calls, called = self.collect()
+        self.setpy.subscribe("DB_*", callback)
+        self.setpy.unsubscribe("DB_*", callback)
+
+        self.setpy["DB_HOST"] = "db"
+
+        self.assertEqual({}, self.setpy.prefix_subscribers)
+        self.assertIsNone(self.setpy.notify_executor)
+
+    def test_failing_callback_reported(self):
+        def failing(changes):
+            raise RuntimeError("broken subscriber")
+
+        self.setpy.subscribe("DB_HOST", failing)
+        with mock.patch("sys.stdout", new_callable=io.StringIO) as stdout:
+            self.setpy["DB_HOST"] = "db"
+            self.setpy.notify_executor.shutdown(wait=True)
+
+        self.assertIn("failed: RuntimeError('broken subscriber')", stdout.getvalue())
+
+    def test_unknown_flag(self):
+        with self.assertRaises(KeyError):
+            self.setpy.update({"DB_HOST": "db", "DOESNT_EXIST": "value"})
+        self.assertEqual("localhost", self.setpy["DB_HOST"])
+
+    def test_subscribe_loop(self):
+        async def main():
+            received = asyncio.get_running_loop().create_future()
+            self.setpy.subscribe("DB_PORT", received.set_result, loop=asyncio.get_running_loop())
+            threading.Thread(target=self.setpy.update, args=({"DB_PORT": 1},)).start()
+            return await asyncio.wait_for(received, 5)
+
+        self.assertEqual({"DB_PORT": 1}, asyncio.run(main()))
+
+    def test_subscribe_closed_loop(self):
+        loop = asyncio.new_event_loop()
+        loop.close()
+        callback, calls, called = self.collect()
+        self.setpy.subscribe("DB_HOST", lambda changes: None, loop=loop)
+        self.setpy.subscribe("DB_HOST", callback)
+
+        with mock.patch("sys.stdout", new_callable=io.StringIO) as stdout:
+            self.setpy["DB_HOST"] = "db"
+
+        self.assertEqual("db", self.setpy["DB_HOST"])
+        self.assertTrue(called.wait(5))
+        self.assertEqual([{"DB_HOST": "db"}], calls)
+        self.assertIn("could not be notified: RuntimeError('Event loop is closed')", stdout.getvalue())
+        self.assertEqual({}, self.setpy.pending_notifications)
+
+
+class TestReadStats(unittest.TestCase):
+
+    def setUp(self):
+        importlib.reload(settipy)
+        self.setpy = settipy.settipy
+        with mock.patch.object(sys, "argv", ["./foo.py"]):
+            with mock.patch.dict(os.environ, {}, clear=True):
+                self.setpy.set("DB_HOST", "localhost", "db host")
+                self.setpy.set_int("DB_PORT", 5432, "db port")
+                self.setpy.set("UNUSED", "", "never read")
+                self.setpy.parse()
+
+    def test_disabled(self):
+        self.assertIs(dict, type(self.setpy.data))
+        with self.assertRaises(Exception):
+            self.setpy.read_stats()
+
+    def test_read_stats(self):
+        self.setpy.enable_read_stats()
+
+        for _ in range(100):
+            self.setpy["DB_PORT"]
+        self.setpy.get("DB_HOST")
+        self.setpy.group("DB")["DB_HOST"]
+
+        stats = self.setpy.read_stats()
+        self.assertEqual({"DB_HOST": 2, "DB_PORT": 100, "UNUSED": 0}, stats["reads"])
+        self.assertEqual(["DB_PORT", "DB_HOST"], stats["hot"])
+        self.assertEqual(["UNUSED"], stats["unread"])
+
+        self.setpy.disable_read_stats()
+        self.assertIs(dict, type(self.setpy.data))
+        self.assertEqual(5432, self.setpy["DB_PORT"])
+
+    def test_update_is_not_a_read(self):
+        self.setpy.enable_read_stats()
+        self.setpy.subscribe("UNUSED", lambda changes: None)
+
+        self.setpy["UNUSED"] = "changed"
+        self.setpy.update({"DB_PORT": 1})
+
+        stats = self.setpy.read_stats()
+        self.assertEqual(0, stats["reads"]["UNUSED"])
+        self.assertEqual(["DB_HOST", "DB_PORT", "UNUSED"], stats["unread"])
+
+    def test_read_stats_every(self):
+        with self.assertRaises(ValueError):
+            self.setpy.enable_read_stats(every=0)
+
+    def test_read_stats_sampled(self):
+        self.setpy.enable_read_stats(every=10)
+
+        for _ in range(1000):
+            self.setpy.get_int("DB_PORT")
+        self.setpy["DB_HOST"]
+
+        stats = self.setpy.read_stats(hot=1)
+        self.assertAlmostEqual(1000, stats["reads"]["DB_PORT"], delta=20)
+        self.assertEqual(1, stats["reads"]["DB_HOST"])
+        self.assertEqual(["DB_PORT"], stats["hot"])
+        self.assertEqual(["UNUSED"], stats["unread"])
+
+    def test_read_stats_alternating(self):
+        self.setpy.enable_read_stats(every=2)
+
+        for _ in range(1000):
+            self.setpy["DB_HOST"]
+            self.setpy["DB_PORT"]
+
+        reads = self.setpy.read_stats()["reads"]
+        self.assertAlmostEqual(1000, reads["DB_HOST"], delta=2)
+        self.assertAlmostEqual(1000, reads["DB_PORT"], delta=2)
+
+
+CHILD_FLAGS = """
+setpy.set("a", "default a", "msg a")
+setpy.set_int("b", 2, "msg b")
+setpy.set_list("c", [], "msg c")
+setpy.set_dict("d", {}, "msg d")
+setpy.set_bool("e", False, "msg e")
+"""
+
+
+class TestHandoff(unittest.TestCase):
+
+    def setUp(self):
+        importlib.reload(settipy)
+
+    def register(self, setpy):
+        exec(CHILD_FLAGS, {"setpy": setpy})
+
+    def parent_export(self):
+        setpy = settipy.settipy
+        patched_argv = ["./foo.py", "-a", "cli-set", "-c", "x,y"]
+        patched_environ = {"b": "42", "d": "k:v"}
+
+        with mock.patch.object(sys, "argv", patched_argv):
+            with mock.patch.dict(os.environ, patched_environ, clear=True):
+                self.register(setpy)
+                setpy.parse()
+        return setpy
+
+    def expected(self):
+        return {"a": "cli-set", "b": 42, "c": ["x", "y"], "d": {"k": "v"}, "e": False}
+
+    def test_handoff_env(self):
+        env = self.parent_export().handoff_env()
+
+        child = settipy.Settipy()
+        child.test_mode = True
+        with mock.patch.object(sys, "argv", ["./foo.py", "-a", "ignored"]):
+            with mock.patch.dict(os.environ, env, clear=True):
+                self.register(child)
+                with mock.patch.object(child, "_handle_env_vars") as handle_env_vars:
+                    child.parse()
+                handle_env_vars.assert_not_called()
+                self.assertNotIn(settipy.HANDOFF_ENV, os.environ)
+
+        self.assertEqual(self.expected(), child.data)
+
+    def test_handoff_corrupt(self):
+        blob = self.parent_export().export()
+        version, digest, payload = blob.split(".")
+
+        for corrupt in [f"SETTIPY0.{digest}.{payload}", f"{version}.{digest}.{payload[:-4]}", "garbage"]:
+            child = settipy.Settipy()
+            child.test_mode = True
+            with mock.patch.object(sys, "argv", ["./foo.py", "-a", "from-cli"]):
+                with mock.patch.dict(os.environ, {settipy.HANDOFF_ENV: corrupt}, clear=True):
+                    self.register(child)
+                    child.parse()
+            self.assertEqual("from-cli", child["a"])
+            self.assertEqual(2, child["b"])
+
+    def test_handoff_different_flags(self):
+        env = self.parent_export().handoff_env()
+
+        child = settipy.Settipy()
+        child.test_mode = True
+        with mock.patch.object(sys, "argv", ["./foo.py"]):
+            with mock.patch.dict(os.environ, env, clear=True):
+                self.register(child)
+                child.set("f", "default f", "msg f")
+                child.parse()
+        self.assertEqual("default a", child["a"])
+
+    def test_handoff_fd_unrelated(self):
+        log = tempfile.TemporaryFile()
+        self.addCleanup(log.close)
+        log.write(b"not a handoff")
+        log.flush()
+        read_fd, write_fd = os.pipe()
+        self.addCleanup(os.close, read_fd)
+        self.addCleanup(os.close, write_fd)
+
+        for fd in (log.fileno(), read_fd):
+            child = settipy.Settipy()
+            child.test_mode = True
+            with mock.patch.object(sys, "argv", ["./foo.py", "-a", "from-cli"]):
+                with mock.patch.dict(os.environ, {settipy.HANDOFF_FD_ENV: str(fd)}, clear=True):
+                    self.register(child)
+                    child.parse()
+            self.assertEqual("from-cli", child["a"])
+            os.fstat(fd)
+        self.assertEqual(b"not a handoff", os.pread(log.fileno(), 100, 0))
+
+    def test_handoff_fd_exec(self):
+        fd, env = self.parent_export().handoff_fd()
+        self.addCleanup(os.close, fd)
+
+        code = "import json, settipy\nsetpy = settipy.settipy\n" + CHILD_FLAGS + "setpy.parse()\nprint(json.dumps(setpy.data))"
+        output = subprocess.run(
+            [sys.executable, "-c", code, "-a", "ignored"],
+            cwd=os.path.dirname(os.path.abspath(settipy.__file__)),
+            env={**os.environ, **env}, pass_fds=[fd],
+            capture_output=True, text=True, check=True,
+        ).stdout
+        self.assertEqual(self.expected(), json.loads(output))
+
+    def test_handoff_fd_plain_exec(self):
+        fd, env = self.parent_export().handoff_fd()
+        self.addCleanup(os.close, fd)
+        self.assertTrue(os.get_inheritable(fd))
+
+        # Without pass_fds, the descriptor is inherited like with os.exec.
+        code = "import json, settipy\nsetpy = settipy.settipy\n" + CHILD_FLAGS + "setpy.parse()\nprint(json.dumps(setpy.data))"
+        output = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=os.path.dirname(os.path.abspath(settipy.__file__)),
+            env={**os.environ, **env}, close_fds=False,
+            capture_output=True, text=True, check=True,
+        ).stdout
+        self.assertEqual(self.expected(), json.loads(output))
+
+    def test_handoff_password_fields(self):
+        setpy = settipy.settipy
+        with mock.patch.object(sys, "argv", ["./foo.py"]):
+            with mock.patch.dict(os.environ, {"PASS": "hunter2"}, clear=True):
+                setpy.set("PASS", "dev", "password", password=True)
+                setpy.parse()
+
+        with self.assertRaises(Exception):
+            setpy.handoff_env()
+
+        # The child in this process reads and closes the descriptor.
+        fd, env = setpy.handoff_fd()
+        child = settipy.Settipy()
+        child.test_mode = True
+        with mock.patch.object(sys, "argv", ["./foo.py"]):
+            with mock.patch.dict(os.environ, env, clear=True):
+                child.set("PASS", "dev", "password", password=True)
+                child.parse()
+        self.assertEqual("hunter2", child["PASS"])
+
+    def test_export_unsupported_values(self):
+        for default in (object(), ("a", "b"), {"a": ("b",)}, {1: "a"}):
+            importlib.reload(settipy)
+            setpy = settipy.settipy
+            with mock.patch.object(sys, "argv", ["./foo.py"]):
+                with mock.patch.dict(os.environ, {}, clear=True):
+                    setpy.set("O", default, "unsupported")
+                    setpy.parse()
+
+            with self.assertRaisesRegex(TypeError, "flag: O"):
+                setpy.export()
+
+
+class TestFastParse(unittest.TestCase):
+
+    def test_fast_parse_matches_reference(self):
+        mismatches, reference, fast = fuzz.differential(fuzz.generate(seed=0, count=1000))
+        self.assertEqual([], mismatches)
+
+
+class TestImport(unittest.TestCase):
+    # Executing the module body, excluding compilation which is cached as bytecode.
+    IMPORT_BUDGET = 0.001
+
+    def test_import_is_lazy(self):
+        code = (
+            "import sys, settipy;"
+            "print('settipy' in vars(settipy), 'asyncio' in sys.modules);"
+            "from settipy import settipy as setpy;"
+            "print(type(setpy).__name__, settipy.settipy is setpy)"
+        )
+        output = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=os.path.dirname(os.path.abspath(settipy.__file__)),
+            capture_output=True, text=True, check=True,
+        ).stdout
+        self.assertEqual("False False\nSettipy True\n", output)
+
+    def test_star_import(self):
+        code = (
+            "from settipy import *;"
+            "print(type(settipy).__name__, RemoteSource.__name__, FileSecretProvider.__name__)"
+        )
+        output = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=os.path.dirname(os.path.abspath(settipy.__file__)),
+            capture_output=True, text=True, check=True,
+        ).stdout
+        self.assertEqual("Settipy RemoteSource FileSecretProvider\n", output)
+
+    def test_import_time_budget(self):
+        with open(settipy.__file__) as fh:
+            code = compile(fh.read(), settipy.__file__, "exec")
+
+        timings = []
+        for _ in range(5):
+            start = time.perf_counter()
+            for _ in range(20):
+                exec(code, {"__name__": "settipy_import_budget"})
+            timings.append((time.perf_counter() - start) / 20)
+
+        self.assertLess(min(timings), self.IMPORT_BUDGET)
+
 
 if __name__ == '__main__':
     unittest.main()